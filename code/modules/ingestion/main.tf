@@ -60,6 +60,15 @@ resource "aws_iam_role_policy" "ingestion_lambda" {
         ]
         Resource = "arn:aws:s3:::${var.s3_bucket_name}/*"
       },
+      {
+        # ListBucket: Find superseded versions of an attachment to delete after
+        # uploading a new one (keys embed the attachment version)
+        Effect = "Allow"
+        Action = [
+          "s3:ListBucket"
+        ]
+        Resource = "arn:aws:s3:::${var.s3_bucket_name}"
+      },
       {
         Effect = "Allow"
         Action = [
@@ -96,12 +105,13 @@ resource "aws_iam_role_policy" "ingestion_lambda" {
       },
       {
         # SSM Parameter Store - Resource-specific permissions
-        # Justification: GetParameter and PutParameter support resource-level permissions
+        # Justification: GetParameter(s) and PutParameter support resource-level permissions
         # Scope: Limited to specific configuration and crawl-state parameters only
         # Security: Parameter ARNs are explicitly scoped, no wildcard parameter access
         Effect = "Allow"
         Action = [
           "ssm:GetParameter",
+          "ssm:GetParameters",
           "ssm:PutParameter"
         ]
         Resource = [
@@ -109,20 +119,6 @@ resource "aws_iam_role_policy" "ingestion_lambda" {
           "arn:aws:ssm:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:parameter${var.ssm_parameter_name}-crawl-state"
         ]
       },
-      {
-        # SSM Parameter Store - Account-level permissions
-        # Justification: DescribeParameters is a list/metadata operation that does not support resource-level permissions
-        # This is required to retrieve KMS key ID for maintaining SecureString encryption
-        # Scope: Read-only metadata access, does not expose parameter values
-        # Security: AWS API limitation - DescribeParameters requires wildcard resource per AWS documentation
-        # Reference: https://docs.aws.amazon.com/systems-manager/latest/userguide/sysman-paramstore-access.html
-        Effect = "Allow"
-        # nosemgrep: terraform.lang.security.iam.no-iam-wildcard-resource
-        Action = [
-          "ssm:DescribeParameters"
-        ]
-        Resource = "*"
-      },
       {
         Effect = "Allow"
         Action = [
@@ -219,6 +215,7 @@ resource "aws_lambda_function" "ingestion" {
       CONFLUENCE_SECRET_ARN   = var.secrets_manager_arn
       CONFIG_PARAMETER        = var.ssm_parameter_name
       CRAWL_STATE_PARAMETER   = aws_ssm_parameter.crawl_state.name
+      CRAWL_STATE_KMS_KEY_ID  = var.kms_ssm_key_arn
     }
   }
 
@@ -55,6 +55,9 @@ echo "📡 Checking AgentCore deployment..."
 if [ ! -f "services/chatbot/.bedrock_agentcore.yaml" ]; then
     echo "⚠️  AgentCore YAML config not found. UI will use SSM parameter configuration."
     echo "   If you see configuration errors, ensure AgentCore is deployed: ./scripts/deploy-chatbot.sh"
+else
+    # Let the UI fall back to the local YAML config if SSM is unavailable
+    export AGENTCORE_YAML_FALLBACK=1
 fi
 
 # Change to UI directory
@@ -59,6 +59,8 @@ class BedrockDocument:
                     'customDocumentIdentifier': {
                         'id': self.document_id
                     },
+                    # Inline TEXT content has no content-encoding option, so it
+                    # is sent as plain text (compressing it would corrupt the index)
                     'sourceType': 'IN_LINE',
                     'inlineContent': {
                         'type': 'TEXT',
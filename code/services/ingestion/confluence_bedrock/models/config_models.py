@@ -33,6 +33,8 @@ class Config:
     log_level: str = "INFO"
     request_timeout: int = 30
     max_retries: int = 3
+    image_workers: int = 8
+    page_workers: int = 4
     
     def __post_init__(self):
         """Validate configuration after initialization"""
@@ -91,6 +93,8 @@ class Config:
                 'log_level': config_data['application'].get('log_level', 'INFO'),
                 'request_timeout': config_data['application'].get('request_timeout', 30),
                 'max_retries': config_data['application'].get('max_retries', 3),
+                'image_workers': config_data['application'].get('image_workers', 8),
+                'page_workers': config_data['application'].get('page_workers', 4),
             }
             
             # Create config instance
@@ -155,7 +159,9 @@ class Config:
                 "output_dir": self.output_dir,
                 "log_level": self.log_level,
                 "request_timeout": self.request_timeout,
-                "max_retries": self.max_retries
+                "max_retries": self.max_retries,
+                "image_workers": self.image_workers,
+                "page_workers": self.page_workers
             }
         }
         
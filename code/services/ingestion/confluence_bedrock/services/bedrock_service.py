@@ -15,10 +15,12 @@ logger = logging.getLogger(__name__)
 class BedrockService:
     """Service for interacting with Bedrock Knowledge Base"""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, bedrock_client: Optional[Any] = None,
+                 bedrock_runtime_client: Optional[Any] = None):
         self.config = config
-        self.bedrock_client = boto3.client('bedrock-agent', region_name=config.aws_region)
-        self.bedrock_runtime_client = boto3.client('bedrock-agent-runtime', region_name=config.aws_region)
+        # Pre-built clients may be passed in so callers can reuse them
+        self.bedrock_client = bedrock_client or boto3.client('bedrock-agent', region_name=config.aws_region)
+        self.bedrock_runtime_client = bedrock_runtime_client or boto3.client('bedrock-agent-runtime', region_name=config.aws_region)
     
     def ingest_documents(self, documents: List[BedrockDocument]) -> List[IngestResponse]:
         """Ingest multiple documents into the knowledge base"""
@@ -32,8 +32,8 @@ class ConfluenceService:
             'Authorization': f'Basic {encoded_credentials}'
         }
         
-        # Create urllib3 PoolManager for HTTP requests
-        self.http = urllib3.PoolManager()
+        # Create urllib3 PoolManager for HTTP requests (sized for concurrent page workers)
+        self.http = urllib3.PoolManager(maxsize=max(10, config.page_workers))
     
     def _validate_url_scheme(self, url: str) -> bool:
         """Validate that URL uses allowed schemes (http/https only)"""
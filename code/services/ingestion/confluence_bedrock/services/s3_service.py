@@ -3,20 +3,24 @@ S3 service for handling attachment storage and retrieval
 """
 import boto3
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, BinaryIO
 from urllib.parse import urlparse
 import os
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError, NoCredentialsError
 
 from ..models.config_models import Config
 
 logger = logging.getLogger(__name__)
 
+# Multipart settings for streamed attachment uploads
+_STREAM_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=4)
+
 
 class S3Service:
     """Service for interacting with S3 for attachment storage"""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, s3_client: Optional[Any] = None):
         self.config = config
         self.region = config.aws_region
         self.attachments_path = config.s3_attachments_path
@@ -29,6 +33,11 @@ class S3Service:
         self.bucket_name = parsed.netloc
         self.base_prefix = parsed.path.lstrip('/')
         
+        # Reuse a pre-built S3 client when given one
+        if s3_client is not None:
+            self.s3_client = s3_client
+            return
+        
         # Initialize S3 client
         try:
             self.s3_client = boto3.client('s3', region_name=self.region)
@@ -56,8 +65,7 @@ class S3Service:
             S3 URI of the uploaded file
         """
         try:
-            # Create S3 key: base_prefix/page_id/attachment_id_filename
-            s3_key = f"{self.base_prefix}{page_id}/{attachment_id}_{filename}"
+            s3_key = self._attachment_key(page_id, attachment_id, filename)
             
             # Prepare upload parameters
             upload_params = {
@@ -86,13 +94,112 @@ class S3Service:
             logger.warning(f"Failed to upload attachment to S3: {e}")
             raise
     
-    def download_attachment(self, s3_uri: str, local_path: str) -> bool:
+    def upload_attachment_stream(self, fileobj: BinaryIO, page_id: str, attachment_id: str,
+                                 filename: str, content_type: str = None,
+                                 version: Optional[int] = None) -> str:
+        """
+        Upload attachment to S3 from a file-like object without buffering it in memory
+        
+        Args:
+            fileobj: Readable binary stream (e.g. an unread HTTP response)
+            page_id: Confluence page ID
+            attachment_id: Confluence attachment ID
+            filename: Original filename
+            content_type: MIME type of the file
+            version: Confluence attachment version, embedded in the key when given
+            
+        Returns:
+            S3 URI of the uploaded file
+        """
+        try:
+            s3_key = self._attachment_key(page_id, attachment_id, filename, version)
+            
+            extra_args = {'StorageClass': 'INTELLIGENT_TIERING'}
+            if content_type:
+                extra_args['ContentType'] = content_type
+            
+            # upload_fileobj switches to multipart for large bodies
+            self.s3_client.upload_fileobj(
+                fileobj,
+                self.bucket_name,
+                s3_key,
+                ExtraArgs=extra_args,
+                Config=_STREAM_TRANSFER_CONFIG
+            )
+            
+            s3_uri = f"s3://{self.bucket_name}/{s3_key}"
+            logger.info(f"Successfully uploaded attachment to S3: {s3_uri}")
+            
+            # Versioned keys are never overwritten, so remove the superseded ones
+            if version is not None:
+                self._delete_other_versions(page_id, attachment_id, s3_key)
+            
+            return s3_uri
+            
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            logger.warning(f"S3 upload failed with error {error_code}: {e}")
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to upload attachment to S3: {e}")
+            raise
+    
+    def _delete_other_versions(self, page_id: str, attachment_id: str, keep_key: str) -> None:
+        """Delete every stored copy of an attachment except keep_key (best effort)
+        
+        Covers older versioned keys and the unversioned key used before
+        versions were added to the key.
+        """
+        prefix = f"{self.base_prefix}{page_id}/{attachment_id}_"
+        try:
+            response = self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix)
+            for obj in response.get('Contents', []):
+                if obj['Key'] != keep_key:
+                    self.s3_client.delete_object(Bucket=self.bucket_name, Key=obj['Key'])
+                    logger.debug(f"Deleted superseded attachment: s3://{self.bucket_name}/{obj['Key']}")
+        except ClientError as e:
+            logger.warning(f"Could not delete superseded versions of attachment {attachment_id}: {e}")
+    
+    def _attachment_key(self, page_id: str, attachment_id: str, filename: str,
+                        version: Optional[int] = None) -> str:
+        """Create S3 key: base_prefix/page_id/attachment_id[_vversion]_filename"""
+        if version is not None:
+            return f"{self.base_prefix}{page_id}/{attachment_id}_v{version}_{filename}"
+        return f"{self.base_prefix}{page_id}/{attachment_id}_{filename}"
+    
+    def head_attachment(self, page_id: str, attachment_id: str, version: int, filename: str) -> Optional[str]:
+        """
+        Look up an already uploaded version of an attachment
+        
+        Args:
+            page_id: Confluence page ID
+            attachment_id: Confluence attachment ID
+            version: Confluence attachment version
+            filename: Original filename
+            
+        Returns:
+            S3 URI if that version is already in S3, None otherwise
+        """
+        s3_key = self._attachment_key(page_id, attachment_id, filename, version)
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return f"s3://{self.bucket_name}/{s3_key}"
+        except ClientError as e:
+            # A missing key is 404, or 403 where s3:ListBucket is not granted
+            if e.response['Error']['Code'] not in ('404', '403'):
+                logger.warning(f"Error checking S3 object existence: {e}")
+            return None
+    
+    def download_attachment(self, s3_uri: str, local_path: str, dir_fd: Optional[int] = None) -> bool:
         """
         Download attachment from S3 to local file
         
         Args:
             s3_uri: S3 URI of the file
             local_path: Local path where to save the file
+            dir_fd: Optional open directory descriptor; when given, local_path is
+                a plain filename (no directory part) relative to it and the
+                directory is assumed to exist
             
         Returns:
             True if successful, False otherwise
@@ -107,11 +214,28 @@ class S3Service:
             bucket = parsed.netloc
             key = parsed.path.lstrip('/')
             
-            # Ensure local directory exists
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            
-            # Download from S3
-            self.s3_client.download_file(bucket, key, local_path)
+            if dir_fd is not None:
+                # Open relative to the already-resolved directory (no per-file path walk).
+                # Download to a temporary name and rename it into place, so a failed
+                # download never leaves an empty or partial file behind.
+                tmp_name = f".{local_path}.{os.getpid()}.tmp"
+                fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, dir_fd=dir_fd)
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        self.s3_client.download_fileobj(bucket, key, f)
+                    os.replace(tmp_name, local_path, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+                except BaseException:
+                    try:
+                        os.unlink(tmp_name, dir_fd=dir_fd)
+                    except OSError:
+                        pass
+                    raise
+            else:
+                # Ensure local directory exists
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                
+                # Download from S3
+                self.s3_client.download_file(bucket, key, local_path)
             
             logger.debug(f"Successfully downloaded {s3_uri} to {local_path}")
             return True
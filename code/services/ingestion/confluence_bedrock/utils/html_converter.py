@@ -9,10 +9,30 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Bold/italic spans: each step of the body consumes exactly one character that
+# cannot start the closing marker, so a failed match cannot backtrack
+# polynomially (no ReDoS on unbalanced markers). Bold may contain single '*' so
+# italic nested inside bold still converts.
+_RE_BOLD = re.compile(r'\*\*((?:[^*\n]|\*(?!\*))+)\*\*')
+_RE_ITALIC = re.compile(r'\*([^*\n]+)\*')
+
 
 class HTMLConverter:
     """Converts retrieved content to HTML format with local image support"""
     
+    # Metadata fields shown in the document information section, in display order
+    _META_FIELDS = (
+        ('title', 'Title'),
+        ('source', 'Source'),
+        ('page_id', 'Page ID'),
+        ('url', 'URL'),
+        ('last_modified', 'Last Modified'),
+        ('version', 'Version'),
+    )
+    
+    # File extensions rendered inline as <img> rather than as a download link
+    _IMAGE_EXTS = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg'})
+    
     def __init__(self, confluence_base_url: str):
         self.confluence_base_url = confluence_base_url
     
@@ -47,48 +67,56 @@ class HTMLConverter:
         """
         s3_refs = []
         
-        # Pattern 1: S3 references in processed content (XML format) - flexible attribute order
-        # <ri:attachment ri:filename="filename.ext" ri:s3-uri="s3://bucket/path" />
-        # or <ri:attachment ri:s3-uri="s3://bucket/path" ri:filename="filename.ext" />
-        pattern1 = r'<ri:attachment[^>]*ri:filename="([^"]+)"[^>]*ri:s3-uri="([^"]+)"[^>]*/>'
-        pattern1_alt = r'<ri:attachment[^>]*ri:s3-uri="([^"]+)"[^>]*ri:filename="([^"]+)"[^>]*/>'
-        
-        matches = re.finditer(pattern1, content)
-        for match in matches:
-            filename = match.group(1)
-            s3_uri = match.group(2)
-            s3_refs.append({
-                'filename': filename,
-                's3_uri': s3_uri,
-                'original_tag': match.group(0)
-            })
-        
-        # Try alternative pattern (s3-uri first, then filename)
-        matches = re.finditer(pattern1_alt, content)
-        for match in matches:
-            s3_uri = match.group(1)
-            filename = match.group(2)
-            # Avoid duplicates
-            if not any(ref['filename'] == filename and ref['s3_uri'] == s3_uri for ref in s3_refs):
+        # Cheap substring checks first - most documents have no S3 images at all
+        has_xml = 'ri:attachment' in content
+        has_s3 = 's3://' in content
+        if not (has_xml or has_s3):
+            return s3_refs
+        
+        if has_xml:
+            # Pattern 1: S3 references in processed content (XML format) - flexible attribute order
+            # <ri:attachment ri:filename="filename.ext" ri:s3-uri="s3://bucket/path" />
+            # or <ri:attachment ri:s3-uri="s3://bucket/path" ri:filename="filename.ext" />
+            pattern1 = r'<ri:attachment[^>]*ri:filename="([^"]+)"[^>]*ri:s3-uri="([^"]+)"[^>]*/>'
+            pattern1_alt = r'<ri:attachment[^>]*ri:s3-uri="([^"]+)"[^>]*ri:filename="([^"]+)"[^>]*/>'
+            
+            matches = re.finditer(pattern1, content)
+            for match in matches:
+                filename = match.group(1)
+                s3_uri = match.group(2)
                 s3_refs.append({
                     'filename': filename,
                     's3_uri': s3_uri,
                     'original_tag': match.group(0)
                 })
+            
+            # Try alternative pattern (s3-uri first, then filename)
+            matches = re.finditer(pattern1_alt, content)
+            for match in matches:
+                s3_uri = match.group(1)
+                filename = match.group(2)
+                # Avoid duplicates
+                if not any(ref['filename'] == filename and ref['s3_uri'] == s3_uri for ref in s3_refs):
+                    s3_refs.append({
+                        'filename': filename,
+                        's3_uri': s3_uri,
+                        'original_tag': match.group(0)
+                    })
         
-        # Pattern 2: Markdown-style S3 references
-        # ![filename](s3://bucket/path)
-        pattern2 = r'!\[([^\]]+)\]\((s3://[^)]+)\)'
-        
-        matches = re.finditer(pattern2, content)
-        for match in matches:
-            filename = match.group(1)
-            s3_uri = match.group(2)
-            s3_refs.append({
-                'filename': filename,
-                's3_uri': s3_uri,
-                'original_tag': match.group(0)
-            })
+        if has_s3:
+            # Pattern 2: Markdown-style S3 references
+            # ![filename](s3://bucket/path)
+            pattern2 = r'!\[([^\]]+)\]\((s3://[^)]+)\)'
+            
+            matches = re.finditer(pattern2, content)
+            for match in matches:
+                filename = match.group(1)
+                s3_uri = match.group(2)
+                s3_refs.append({
+                    'filename': filename,
+                    's3_uri': s3_uri,
+                    'original_tag': match.group(0)
+                })
         
         logger.debug(f"Found {len(s3_refs)} S3 image references in content")
         return s3_refs
@@ -118,10 +146,9 @@ class HTMLConverter:
             local_image_path = f"{local_images_dir}/{filename}"
             
             # Determine if it's an image based on extension
-            image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg'}
             file_ext = os.path.splitext(filename.lower())[1]
             
-            if file_ext in image_extensions:
+            if file_ext in self._IMAGE_EXTS:
                 # Create img tag for images
                 return f'<img src="{local_image_path}" alt="{filename}" title="{filename}" style="max-width: 100%; height: auto;" onerror="this.style.display=\'none\'; this.nextSibling.style.display=\'inline\'"><span style="display:none; color: #666; font-style: italic;">[Image: {filename} - Could not load]</span>'
             else:
@@ -141,10 +168,9 @@ class HTMLConverter:
             local_image_path = f"{local_images_dir}/{filename}"
             
             # Determine if it's an image based on extension
-            image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg'}
             file_ext = os.path.splitext(filename.lower())[1]
             
-            if file_ext in image_extensions:
+            if file_ext in self._IMAGE_EXTS:
                 # Create img tag for images
                 return f'<img src="{local_image_path}" alt="{filename}" title="{filename}" style="max-width: 100%; height: auto;" onerror="this.style.display=\'none\'; this.nextSibling.style.display=\'inline\'"><span style="display:none; color: #666; font-style: italic;">[Image: {filename} - Could not load]</span>'
             else:
@@ -246,25 +272,12 @@ class HTMLConverter:
     
     def _create_metadata_section(self, metadata: Dict[str, Any]) -> str:
         """Create HTML metadata section"""
-        metadata_items = []
-        
-        if 'title' in metadata:
-            metadata_items.append(f"<strong>Title:</strong> {metadata['title']}")
-        
-        if 'source' in metadata:
-            metadata_items.append(f"<strong>Source:</strong> {metadata['source']}")
-        
-        if 'page_id' in metadata:
-            metadata_items.append(f"<strong>Page ID:</strong> {metadata['page_id']}")
-        
-        if 'url' in metadata:
-            metadata_items.append(f"<strong>URL:</strong> <a href=\"{metadata['url']}\" target=\"_blank\">{metadata['url']}</a>")
-        
-        if 'last_modified' in metadata:
-            metadata_items.append(f"<strong>Last Modified:</strong> {metadata['last_modified']}")
-        
-        if 'version' in metadata:
-            metadata_items.append(f"<strong>Version:</strong> {metadata['version']}")
+        metadata_items = [
+            f"<strong>{label}:</strong> <a href=\"{metadata[key]}\" target=\"_blank\">{metadata[key]}</a>"
+            if key == 'url' else f"<strong>{label}:</strong> {metadata[key]}"
+            for key, label in self._META_FIELDS
+            if key in metadata
+        ]
         
         if metadata_items:
             items_html = "<br>".join(metadata_items)
@@ -286,8 +299,8 @@ class HTMLConverter:
         content = re.sub(r'^###### (.*?)$', r'<h6>\1</h6>', content, flags=re.MULTILINE)
         
         # Bold and italic
-        content = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', content)
-        content = re.sub(r'\*(.*?)\*', r'<em>\1</em>', content)
+        content = _RE_BOLD.sub(r'<strong>\1</strong>', content)
+        content = _RE_ITALIC.sub(r'<em>\1</em>', content)
         
         # Code blocks
         content = re.sub(r'```(\w+)?\n(.*?)\n```', r'<pre><code class="language-\1">\2</code></pre>', content, flags=re.DOTALL)
@@ -296,31 +309,36 @@ class HTMLConverter:
         content = re.sub(r'`([^`]+)`', r'<code>\1</code>', content)
         
         # Lists - fix the regex to handle multiple list items properly
-        lines = content.split('\n')
-        processed_lines = []
-        in_list = False
-        
-        for line in lines:
-            if line.strip().startswith('- '):
-                if not in_list:
-                    processed_lines.append('<ul>')
-                    in_list = True
-                list_item = line.strip()[2:]  # Remove '- '
-                processed_lines.append(f'<li>{list_item}</li>')
-            else:
-                if in_list:
-                    processed_lines.append('</ul>')
-                    in_list = False
-                processed_lines.append(line)
-        
-        if in_list:
-            processed_lines.append('</ul>')
-        
-        content = '\n'.join(processed_lines)
+        # (only walk line by line when a list marker can be present at all)
+        if '- ' in content:
+            lines = content.split('\n')
+            processed_lines = []
+            append = processed_lines.append
+            in_list = False
+            
+            for line in lines:
+                stripped = line.strip()
+                if stripped.startswith('- '):
+                    if not in_list:
+                        append('<ul>')
+                        in_list = True
+                    append(f'<li>{stripped[2:]}</li>')  # Remove '- '
+                else:
+                    if in_list:
+                        append('</ul>')
+                        in_list = False
+                    append(line)
+            
+            if in_list:
+                append('</ul>')
+            
+            content = '\n'.join(processed_lines)
         
-        # Notes and warnings
-        content = re.sub(r'\*\*Note:\*\* (.*?)(?=\n\n|\n$|$)', r'<div class="note"><strong>Note:</strong> \1</div>', content, flags=re.DOTALL)
-        content = re.sub(r'\*\*Warning:\*\* (.*?)(?=\n\n|\n$|$)', r'<div class="warning"><strong>Warning:</strong> \1</div>', content, flags=re.DOTALL)
+        # Notes and warnings (skip the regex scan when the marker is absent)
+        if '**Note:**' in content:
+            content = re.sub(r'\*\*Note:\*\* (.*?)(?=\n\n|\n$|$)', r'<div class="note"><strong>Note:</strong> \1</div>', content, flags=re.DOTALL)
+        if '**Warning:**' in content:
+            content = re.sub(r'\*\*Warning:\*\* (.*?)(?=\n\n|\n$|$)', r'<div class="warning"><strong>Warning:</strong> \1</div>', content, flags=re.DOTALL)
         
         # Paragraphs - improved logic
         paragraphs = content.split('\n\n')
@@ -434,37 +452,52 @@ class HTMLConverter:
         if s3_service and s3_image_refs:
             logger.info(f"Downloading {len(s3_image_refs)} images from S3...")
             
-            for img_ref in s3_image_refs:
-                try:
-                    filename_only = img_ref['filename']
-                    s3_uri = img_ref['s3_uri']
-                    local_image_path = os.path.join(images_dir, filename_only)
-                    
-                    success = s3_service.download_attachment(s3_uri, local_image_path)
-                    download_results.append({
-                        'filename': filename_only,
-                        's3_uri': s3_uri,
-                        'local_path': local_image_path,
-                        'success': success
-                    })
-                    
-                    if success:
-                        logger.info(f"✅ Downloaded: {filename_only}")
-                    else:
-                        logger.error(f"❌ Failed to download: {filename_only}")
+            # Resolve images_dir once and open each file relative to it where supported
+            dir_fd = None
+            if hasattr(os, 'O_DIRECTORY') and os.open in os.supports_dir_fd:
+                dir_fd = os.open(images_dir, os.O_RDONLY | os.O_DIRECTORY)
+            
+            try:
+                for img_ref in s3_image_refs:
+                    try:
+                        filename_only = img_ref['filename']
+                        s3_uri = img_ref['s3_uri']
+                        local_image_path = os.path.join(images_dir, filename_only)
                         
-                except Exception as e:
-                    logger.error(f"Error downloading {img_ref.get('filename', 'unknown')}: {e}")
-                    download_results.append({
-                        'filename': img_ref.get('filename', 'unknown'),
-                        's3_uri': img_ref.get('s3_uri', ''),
-                        'local_path': '',
-                        'success': False,
-                        'error': str(e)
-                    })
+                        # Names with a directory part need the path-based download,
+                        # which creates the subdirectory
+                        if dir_fd is not None and os.path.basename(filename_only) == filename_only:
+                            success = s3_service.download_attachment(s3_uri, filename_only, dir_fd=dir_fd)
+                        else:
+                            success = s3_service.download_attachment(s3_uri, local_image_path)
+                        download_results.append({
+                            'filename': filename_only,
+                            's3_uri': s3_uri,
+                            'local_path': local_image_path,
+                            'success': success
+                        })
+                        
+                        if success:
+                            logger.info(f"✅ Downloaded: {filename_only}")
+                        else:
+                            logger.error(f"❌ Failed to download: {filename_only}")
+                            
+                    except Exception as e:
+                        logger.error(f"Error downloading {img_ref.get('filename', 'unknown')}: {e}")
+                        download_results.append({
+                            'filename': img_ref.get('filename', 'unknown'),
+                            's3_uri': img_ref.get('s3_uri', ''),
+                            'local_path': '',
+                            'success': False,
+                            'error': str(e)
+                        })
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
         
         # Replace S3 references with local paths in HTML content AFTER downloading
-        if s3_image_refs:
+        # (skipped when convert_retrieved_content_to_html already resolved them)
+        if s3_image_refs and 's3://' in html_content:
             logger.debug("Replacing S3 references with local image paths...")
             html_content = self.replace_s3_references_with_local_paths(html_content, "images")
         
@@ -2,18 +2,58 @@
 Image processor for downloading and uploading Confluence images
 """
 import os
+import re
 import logging
 from typing import Dict, List, Any, Optional
 import urllib.parse
 import base64
 from urllib.parse import urlparse, unquote
 import urllib3
+from botocore.exceptions import BotoCoreError, ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from ..models.config_models import Config
 from ..services.s3_service import S3Service
 
 logger = logging.getLogger(__name__)
 
+# Shared across ImageProcessor instances so a warm Lambda container keeps its
+# keep-alive connections to Confluence between spaces and invocations
+_HTTP_POOL: Optional[urllib3.PoolManager] = None
+
+
+def _get_http_pool(maxsize: int) -> urllib3.PoolManager:
+    """Return the module-level PoolManager, creating it on first use"""
+    global _HTTP_POOL
+    if _HTTP_POOL is None:
+        _HTTP_POOL = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=max(16, maxsize),  # never smaller than the concurrent image downloads
+            block=False,
+            retries=urllib3.Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+        )
+    return _HTTP_POOL
+
+
+# Per-request policy for image downloads: follow up to 5 redirects and strip
+# credentials on cross-host hops; a redirect loop returns the last 3xx response
+_REDIRECT_RETRY = urllib3.Retry(
+    total=None,
+    connect=3,
+    read=3,
+    status=3,
+    redirect=5,
+    backoff_factor=0.3,
+    status_forcelist=[429, 502, 503, 504],
+    remove_headers_on_redirect=frozenset(['Authorization']),
+    raise_on_redirect=False
+)
+
+
+# Self-closing ri:attachment tags: (tag start)(filename)(closing "/>")
+_ATTACHMENT_RE = re.compile(r'(<ri:attachment\b[^>]*?ri:filename="([^"]+)"[^>]*?)(/>)')
+_S3_URI_ATTR_RE = re.compile(r'ri:s3-uri="[^"]*"')
+
 
 class ImageProcessor:
     """Processes images from Confluence content"""
@@ -23,6 +63,11 @@ class ImageProcessor:
         self.s3_service = s3_service
         self.confluence_base_url = config.get_confluence_base_url()
         
+        # Download URLs are built from the base URL, so validating its scheme
+        # once here covers every initial request
+        if not self._validate_url_scheme(self.confluence_base_url):
+            raise ValueError(f"Invalid URL scheme. Only http/https allowed: {self.confluence_base_url}")
+        
         # Create basic auth header for Confluence
         credentials = f"{config.confluence_email}:{config.confluence_api_token}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
@@ -32,8 +77,13 @@ class ImageProcessor:
             'User-Agent': 'Confluence-Bedrock-Integration/1.0'
         }
         
-        # Create urllib3 PoolManager for HTTP requests
-        self.http = urllib3.PoolManager()
+        # Shared urllib3 PoolManager for HTTP requests
+        # Up to page_workers pages download image_workers images each at once
+        self.http = _get_http_pool((config.page_workers or 4) * config.image_workers)
+        
+        # Host of the Confluence site; credentials are only ever sent to it
+        # or to other Atlassian Cloud hosts
+        self._confluence_host = urlparse(self.confluence_base_url).hostname
     
     def process_page_images(self, page_id: str, storage_content: str, attachments: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Process all images in a page's storage content"""
@@ -49,50 +99,53 @@ class ImageProcessor:
             logger.debug(f"No attachments found for page {page_id}")
             return result
         
-        # Create a lookup dictionary for attachments by filename
-        attachment_lookup = {}
-        for attachment in attachments:
-            filename = attachment.get('title', '')
-            if filename:
-                attachment_lookup[filename] = attachment
-        
         logger.info(f"Processing {len(attachments)} attachments for page {page_id}")
         
-        # Process each attachment
-        for attachment in attachments:
-            try:
-                filename = attachment.get('title', '')
-                if not filename:
-                    continue
-                
-                # Check if it's an image
-                media_type = attachment.get('extensions', {}).get('mediaType', '')
-                if not media_type.startswith('image/'):
-                    logger.debug(f"Skipping non-image attachment: {filename}")
-                    continue
-                
-                result['processed_images'] += 1
-                
-                # Download and upload image
-                s3_uri = self._download_and_upload_image(page_id, attachment)
-                
-                if s3_uri:
-                    result['successful_uploads'] += 1
-                    # Use the actual S3 URI returned from upload
-                    result['modified_content'] = self._add_s3_uri_to_content(
-                        result['modified_content'], filename, s3_uri
-                    )
-                    logger.info(f"✅ Successfully processed image: {filename}")
-                else:
-                    result['failed_uploads'] += 1
-                    result['errors'].append(f"Failed to upload {filename}")
-                    logger.error(f"🔴 Failed to process image: {filename}")
+        # Select named image attachments
+        images = [
+            attachment for attachment in attachments
+            if attachment.get('title') and attachment.get('extensions', {}).get('mediaType', '').startswith('image/')
+        ]
+        
+        if not images:
+            logger.debug(f"No image attachments found for page {page_id}")
+            return result
+        
+        result['processed_images'] = len(images)
+        
+        # Download and upload images in parallel (network-bound); the content
+        # is rewritten once, on this thread, after all transfers complete
+        upload_results = {}
+        max_workers = min(self.config.image_workers, len(images))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._download_and_upload_image, page_id, attachment): attachment['title']
+                for attachment in images
+            }
+            
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    s3_uri = future.result()
                     
-            except Exception as e:
-                result['failed_uploads'] += 1
-                error_msg = f"Error processing {filename}: {str(e)}"
-                result['errors'].append(error_msg)
-                logger.error(f"🔴 {error_msg}")
+                    if s3_uri:
+                        result['successful_uploads'] += 1
+                        # Use the actual S3 URI returned from upload
+                        upload_results[filename] = s3_uri
+                        logger.info(f"✅ Successfully processed image: {filename}")
+                    else:
+                        result['failed_uploads'] += 1
+                        result['errors'].append(f"Failed to upload {filename}")
+                        logger.error(f"🔴 Failed to process image: {filename}")
+                        
+                except (urllib3.exceptions.HTTPError, BotoCoreError, ClientError, OSError, KeyError) as e:
+                    result['failed_uploads'] += 1
+                    error_msg = f"Error processing {filename}: {str(e)}"
+                    result['errors'].append(error_msg)
+                    logger.error(f"🔴 {error_msg}")
+        
+        if upload_results:
+            result['modified_content'] = self._apply_all_s3_uris(storage_content, upload_results)
         
         logger.info(f"Image processing complete for page {page_id}: "
                    f"{result['successful_uploads']}/{result['processed_images']} successful")
@@ -104,45 +157,57 @@ class ImageProcessor:
         
         Returns:
             S3 URI if successful, None if failed
+        
+        Raises:
+            Download and upload errors, which the caller records as failures
         """
+        filename = attachment.get('title', '')
+        if not filename:
+            return None
+        
+        # An unchanged attachment version from an earlier crawl is already in S3
+        attachment_id = attachment.get('id', 'unknown')
+        version = attachment.get('version', {}).get('number')
+        if version is not None:
+            existing_uri = self.s3_service.head_attachment(page_id, attachment_id, version, filename)
+            if existing_uri:
+                logger.debug(f"Image {filename} v{version} already in S3: {existing_uri}")
+                return existing_uri
+        
+        # URL-encode the filename to handle spaces and Unicode characters
+        encoded_filename = urllib.parse.quote(filename, safe='')
+        
+        # Use the simple, reliable URL format that works
+        image_url = f"{self.confluence_base_url}/wiki/download/attachments/{page_id}/{encoded_filename}"
+        
+        logger.info(f"Downloading {filename} from: {image_url}")
+        
+        # Open the download stream
+        response = self._download_image(image_url)
+        if response is None:
+            return None
+        
+        # Stream to S3 - let S3Service handle the path
+        media_type = attachment.get('extensions', {}).get('mediaType', 'application/octet-stream')
+        
         try:
-            filename = attachment.get('title', '')
-            if not filename:
-                return None
-            
-            # URL-encode the filename to handle spaces and Unicode characters
-            encoded_filename = urllib.parse.quote(filename, safe='')
-            
-            # Use the simple, reliable URL format that works
-            image_url = f"{self.confluence_base_url}/wiki/download/attachments/{page_id}/{encoded_filename}"
-            
-            logger.info(f"Downloading {filename} from: {image_url}")
-            
-            # Download image
-            image_data = self._download_image(image_url)
-            if not image_data:
-                return None
-            
-            # Upload to S3 - let S3Service handle the path
-            media_type = attachment.get('extensions', {}).get('mediaType', 'application/octet-stream')
-            
-            s3_uri = self.s3_service.upload_attachment(
-                file_content=image_data,
+            s3_uri = self.s3_service.upload_attachment_stream(
+                fileobj=response,
                 page_id=page_id,
-                attachment_id=attachment.get('id', 'unknown'),
+                attachment_id=attachment_id,
                 filename=filename,
-                content_type=media_type
+                content_type=media_type,
+                version=version
             )
-            
-            if s3_uri:
-                logger.debug(f"Successfully uploaded {filename} to S3: {s3_uri}")
-                return s3_uri
-            else:
-                logger.error(f"Failed to upload {filename} to S3")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error in _download_and_upload_image for {filename}: {e}")
+        finally:
+            # Return the socket to the pool
+            response.release_conn()
+        
+        if s3_uri:
+            logger.debug(f"Successfully uploaded {filename} to S3: {s3_uri}")
+            return s3_uri
+        else:
+            logger.error(f"Failed to upload {filename} to S3")
             return None
     
     def _validate_url_scheme(self, url: str) -> bool:
@@ -150,52 +215,55 @@ class ImageProcessor:
         parsed = urllib.parse.urlparse(url)
         return parsed.scheme in ('http', 'https')
     
-    def _download_image(self, image_url: str) -> Optional[bytes]:
-        """Download image from URL with proper redirect handling"""
+    def _is_trusted_host(self, url: str) -> bool:
+        """Check whether credentials may be sent to the host of the given URL"""
+        host = urlparse(url).hostname or ''
+        return host == self._confluence_host or host.endswith('.atlassian.net')
+    
+    def _download_image(self, image_url: str) -> Optional[urllib3.HTTPResponse]:
+        """Open an image download with proper redirect handling
+        
+        Returns:
+            Unread response whose body is streamed on read(); the caller must
+            call release_conn() on it. None if the download failed.
+        """
         try:
-            # Validate URL scheme for security
-            if not self._validate_url_scheme(image_url):
-                logger.error(f"Invalid URL scheme. Only http/https allowed: {image_url}")
-                return None
-            
-            # Use urllib3 with redirect handling
-            # Follow redirects manually to preserve auth headers for Atlassian domains
-            max_redirects = 5
-            current_url = image_url
+            # Let urllib3 follow redirects; it drops the Authorization header
+            # whenever a redirect leaves the original host
+            response = self.http.request(
+                'GET',
+                image_url,
+                headers=self.headers,
+                timeout=self.config.request_timeout,
+                retries=_REDIRECT_RETRY,
+                redirect=True,
+                preload_content=False,
+                decode_content=True
+            )
             
-            for redirect_count in range(max_redirects):
+            # A redirect to another Atlassian host may still need credentials
+            final_url = urllib.parse.urljoin(image_url, response.geturl() or image_url)
+            if (response.status in (401, 403) and final_url != image_url
+                    and self._validate_url_scheme(final_url) and self._is_trusted_host(final_url)):
+                logger.info(f"Retrying {final_url} with credentials")
+                response.drain_conn()
+                response.release_conn()
                 response = self.http.request(
                     'GET',
-                    current_url,
+                    final_url,
                     headers=self.headers,
                     timeout=self.config.request_timeout,
-                    redirect=False  # Handle redirects manually
+                    redirect=False,
+                    preload_content=False,
+                    decode_content=True
                 )
-                
-                # Success - return the data
-                if response.status == 200:
-                    return response.data
-                
-                # Handle redirects (301, 302, 303, 307, 308)
-                if response.status in (301, 302, 303, 307, 308):
-                    redirect_url = response.headers.get('Location')
-                    if not redirect_url:
-                        logger.error(f"Redirect without Location header from {current_url}")
-                        return None
-                    
-                    # Log redirect for debugging
-                    logger.info(f"Redirecting {current_url} -> {redirect_url}")
-                    
-                    # Update current URL for next iteration
-                    current_url = redirect_url
-                    continue
-                
-                # Other status codes are errors
-                logger.error(f"HTTP {response.status} when downloading {current_url}")
-                return None
             
-            # Too many redirects
-            logger.error(f"Too many redirects (>{max_redirects}) when downloading {image_url}")
+            if response.status == 200:
+                return response
+            
+            logger.error(f"HTTP {response.status} when downloading {final_url}")
+            response.drain_conn()
+            response.release_conn()
             return None
                     
         except urllib3.exceptions.HTTPError as e:
@@ -211,53 +279,34 @@ class ImageProcessor:
             logger.error(f"Unexpected error downloading {image_url}: {e}")
             return None
     
-    def _add_s3_uri_to_content(self, content: str, filename: str, s3_uri: str) -> str:
-        """Add S3 URI to ri:attachment tags in content"""
-        import re
+    def _apply_all_s3_uris(self, content: str, upload_results: Dict[str, str]) -> str:
+        """Add S3 URIs to all matching ri:attachment tags in a single pass
         
-        # Pattern to find ri:attachment tags with the specific filename
-        pattern = f'(<ri:attachment[^>]*ri:filename="{re.escape(filename)}"[^>]*)(/>)'
+        Storage format is edited textually rather than parsed: it may contain
+        HTML entities that are not valid XML, and re-serializing a tree would
+        rewrite untouched markup.
+        
+        Args:
+            content: Page storage content
+            upload_results: Mapping of attachment filename to uploaded S3 URI
+        """
         
         # Replace with version that includes S3 URI
         def replacement(match):
+            s3_uri = upload_results.get(match.group(2))
+            if not s3_uri:
+                return match.group(0)
+            
             tag_start = match.group(1)
-            tag_end = match.group(2)
+            tag_end = match.group(3)
             
             # Add S3 URI attribute if not already present
             if 'ri:s3-uri=' not in tag_start:
                 return f'{tag_start} ri:s3-uri="{s3_uri}"{tag_end}'
             else:
                 # Update existing S3 URI
-                updated_tag = re.sub(
-                    r'ri:s3-uri="[^"]*"',
-                    f'ri:s3-uri="{s3_uri}"',
-                    tag_start
-                )
+                updated_tag = _S3_URI_ATTR_RE.sub(f'ri:s3-uri="{s3_uri}"', tag_start)
                 return f'{updated_tag}{tag_end}'
         
-        modified_content = re.sub(pattern, replacement, content)
-        
-        # Also handle ac:image tags that contain ri:attachment
-        ac_image_pattern = f'(<ac:image[^>]*>.*?<ri:attachment[^>]*ri:filename="{re.escape(filename)}"[^>]*)(/>)(.*?</ac:image>)'
-        
-        def ac_image_replacement(match):
-            before_attachment = match.group(1)
-            attachment_end = match.group(2)
-            after_attachment = match.group(3)
-            
-            # Add S3 URI to the ri:attachment tag
-            if 'ri:s3-uri=' not in before_attachment:
-                updated_attachment = f'{before_attachment} ri:s3-uri="{s3_uri}"{attachment_end}'
-            else:
-                # Update existing S3 URI
-                updated_attachment = re.sub(
-                    r'ri:s3-uri="[^"]*"',
-                    f'ri:s3-uri="{s3_uri}"',
-                    before_attachment
-                ) + attachment_end
-            
-            return f'{updated_attachment}{after_attachment}'
-        
-        modified_content = re.sub(ac_image_pattern, ac_image_replacement, modified_content, flags=re.DOTALL)
-        
-        return modified_content
+        # ri:attachment tags nested in ac:image are rewritten by the same pass
+        return _ATTACHMENT_RE.sub(replacement, content)
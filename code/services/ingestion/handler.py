@@ -5,71 +5,96 @@ import json
 import logging
 import os
 import boto3
-import time
+import heapq
+import threading
+from botocore.config import Config as BotoConfig
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional
 
+# confluence_service must be imported before image_processor (circular import)
+from confluence_bedrock.services.confluence_service import ConfluenceService
+from confluence_bedrock.services.bedrock_service import BedrockService
+from confluence_bedrock.services.s3_service import S3Service
+from confluence_bedrock.utils.content_processor import ContentProcessor
+from confluence_bedrock.utils.image_processor import ImageProcessor
+from confluence_bedrock.models.bedrock_models import BedrockDocument, BedrockMetadata
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# AWS clients
-ssm = boto3.client('ssm')
-secrets_manager = boto3.client('secretsmanager')
+# Maximum documents per IngestKnowledgeBaseDocuments call
+INGEST_BATCH_SIZE = 10
+# Maximum total inline content per call, kept well under the API's request size limit
+INGEST_BATCH_MAX_BYTES = 5 * 1024 * 1024
+
+# AWS session and clients, reused across invocations of a warm container
+_SESSION = boto3.Session()
+_AWS_REGION = _SESSION.region_name or os.environ.get('AWS_REGION')
+# SSM retries use botocore's adaptive mode (client-side rate limiting with jittered backoff)
+ssm = _SESSION.client('ssm', config=BotoConfig(retries={'mode': 'adaptive', 'max_attempts': 5}))
+secrets_manager = _SESSION.client('secretsmanager')
+
+# Clients for the ingestion services, created on first use per (service, region)
+_service_clients: Dict[tuple, Any] = {}
+
+
+def _get_client(service_name: str, region: str, max_pool_connections: Optional[int] = None) -> Any:
+    """Return a cached boto3 client for the given service, region and pool size"""
+    key = (service_name, region, max_pool_connections)
+    if key not in _service_clients:
+        client_config = None
+        if max_pool_connections:
+            client_config = BotoConfig(max_pool_connections=max_pool_connections)
+        _service_clients[key] = _SESSION.client(service_name, region_name=region, config=client_config)
+    return _service_clients[key]
 
 
 class SSMCrawlTracker:
     """Tracks crawl state in SSM Parameter Store using JSON"""
     
-    def __init__(self, parameter_name: str):
+    def __init__(self, parameter_name: str, kms_key_id: Optional[str] = None):
         self.parameter_name = parameter_name
-    
-    def _retry_ssm_operation(self, operation, max_retries=3):
-        """Retry SSM operations with exponential backoff"""
-        for attempt in range(max_retries):
-            try:
-                return operation()
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    raise
-                wait_time = (2 ** attempt) * 0.5
-                logger.warning(f"SSM operation failed (attempt {attempt + 1}), retrying in {wait_time}s: {e}")
-                time.sleep(wait_time)
+        # KMS key used to encrypt the SecureString on write (None for the SSM default key)
+        self.kms_key_id = kms_key_id
+        # In-memory copy of the state for this invocation (None until first read)
+        self._state_cache: Optional[Dict[str, Any]] = None
+        # Checkpoints are written by a single background thread; saves that
+        # arrive while a write is queued are coalesced into it
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._write_queued = False
+        self._last_write: Optional[Future] = None
     
     def _get_crawl_state(self) -> Dict[str, Any]:
-        """Get current crawl state from SSM"""
-        def get_param():
-            try:
-                response = ssm.get_parameter(Name=self.parameter_name, WithDecryption=True)
-                return json.loads(response['Parameter']['Value'])
-            except ssm.exceptions.ParameterNotFound:
-                return {}
+        """Get current crawl state (read from SSM once, then served from memory)"""
+        if self._state_cache is not None:
+            return self._state_cache
         
-        return self._retry_ssm_operation(get_param)
+        try:
+            response = ssm.get_parameter(Name=self.parameter_name, WithDecryption=True)
+            self._state_cache = json.loads(response['Parameter']['Value'])
+        except ssm.exceptions.ParameterNotFound:
+            self._state_cache = {}
+        
+        return self._state_cache
     
     def _save_crawl_state(self, state: Dict[str, Any]) -> None:
         """Save crawl state to SSM"""
-        def put_param():
-            # Get parameter metadata to retrieve KMS key ID
-            param_info = ssm.describe_parameters(
-                Filters=[{'Key': 'Name', 'Values': [self.parameter_name]}]
-            )
-            
-            # Prepare put_parameter arguments
-            put_params = {
-                'Name': self.parameter_name,
-                'Value': json.dumps(state),
-                'Type': 'SecureString',
-                'Overwrite': True
-            }
-            
-            # Add KMS key ID if parameter uses one
-            if param_info['Parameters'] and 'KeyId' in param_info['Parameters'][0]:
-                put_params['KeyId'] = param_info['Parameters'][0]['KeyId']
-            
-            ssm.put_parameter(**put_params)
+        # Prepare put_parameter arguments
+        put_params = {
+            'Name': self.parameter_name,
+            'Value': json.dumps(state),
+            'Type': 'SecureString',
+            'Overwrite': True
+        }
+        
+        # Keep the parameter on its configured KMS key
+        if self.kms_key_id:
+            put_params['KeyId'] = self.kms_key_id
         
-        self._retry_ssm_operation(put_param)
+        ssm.put_parameter(**put_params)
     
     def get_last_crawl_time(self, space_key: str) -> Optional[datetime]:
         """Get last crawl time for a space"""
@@ -87,27 +112,52 @@ class SSMCrawlTracker:
         return None
     
     def save_last_crawl_time(self, space_key: str, crawl_time: datetime) -> None:
-        """Save last crawl time for a space"""
+        """Save last crawl time for a space (written to SSM in the background)"""
         try:
             state = self._get_crawl_state()
-            state[space_key] = {
-                'last_crawl_time': crawl_time.isoformat(),
-                'updated_at': datetime.now(timezone.utc).isoformat()
-            }
-            
-            self._save_crawl_state(state)
-            logger.info(f"Saved last crawl time for {space_key}: {crawl_time}")
+            with self._lock:
+                state[space_key] = {
+                    'last_crawl_time': crawl_time.isoformat(),
+                    'updated_at': datetime.now(timezone.utc).isoformat()
+                }
+                
+                if not self._write_queued:
+                    self._write_queued = True
+                    self._last_write = self._writer.submit(self._flush)
             
         except Exception as e:
             logger.error(f"Failed to save last crawl time for {space_key}: {e}")
+    
+    def _flush(self) -> None:
+        """Write the latest cached state to SSM"""
+        with self._lock:
+            self._write_queued = False
+            state = dict(self._state_cache)
+        
+        try:
+            self._save_crawl_state(state)
+            logger.info(f"Saved crawl state: {state}")
+        except Exception as e:
+            logger.error(f"Failed to save crawl state: {e}")
+    
+    def flush_and_wait(self) -> None:
+        """Block until all pending crawl state writes have reached SSM"""
+        with self._lock:
+            pending = self._last_write
+        if pending:
+            pending.result()
 
 
 def load_configuration() -> Dict[str, Any]:
     """Load configuration from SSM Parameter Store"""
     try:
         parameter_name = os.environ['CONFIG_PARAMETER']
-        response = ssm.get_parameter(Name=parameter_name, WithDecryption=True)
-        config = json.loads(response['Parameter']['Value'])
+        # Batch read (extend Names if more parameters are needed at startup)
+        response = ssm.get_parameters(Names=[parameter_name], WithDecryption=True)
+        if response.get('InvalidParameters'):
+            raise ValueError(f"SSM parameter(s) not found: {response['InvalidParameters']}")
+        parameters = {p['Name']: p['Value'] for p in response['Parameters']}
+        config = json.loads(parameters[parameter_name])
         
         # Load Confluence token from Secrets Manager
         secret_arn = os.environ['CONFLUENCE_SECRET_ARN']
@@ -120,8 +170,7 @@ def load_configuration() -> Dict[str, Any]:
         config['aws_region'] = os.environ.get('AWS_REGION')
         if not config['aws_region']:
             # Use boto3 session region as fallback
-            session = boto3.Session()
-            config['aws_region'] = session.region_name
+            config['aws_region'] = _AWS_REGION
             if not config['aws_region']:
                 raise ValueError("AWS region not found in environment variable AWS_REGION and no default region configured in boto3 session.")
         
@@ -134,6 +183,10 @@ def load_configuration() -> Dict[str, Any]:
 def create_config_object(config_dict: Dict[str, Any]) -> Any:
     """Create a Config object from dictionary (simplified version)"""
     class SimpleConfig:
+        # Defaults for optional settings that may be absent from the SSM config
+        image_workers = 8
+        page_workers = 4
+        
         def __init__(self, **kwargs):
             for key, value in kwargs.items():
                 setattr(self, key, value)
@@ -144,23 +197,114 @@ def create_config_object(config_dict: Dict[str, Any]) -> Any:
     return SimpleConfig(**config_dict)
 
 
-def process_space_incrementally(space_key: str, config: Any, crawler_tracker: SSMCrawlTracker) -> Dict[str, Any]:
-    """Process a single space incrementally"""
-    from confluence_bedrock.services.confluence_service import ConfluenceService
-    from confluence_bedrock.services.bedrock_service import BedrockService
-    from confluence_bedrock.services.s3_service import S3Service
-    from confluence_bedrock.utils.content_processor import ContentProcessor
-    from confluence_bedrock.utils.image_processor import ImageProcessor
-    from confluence_bedrock.models.bedrock_models import BedrockDocument, BedrockMetadata
+def _prepare_page_document(page: Any, space_key: str, config: Any, confluence_service: ConfluenceService,
+                           content_processor: ContentProcessor, image_processor: ImageProcessor) -> BedrockDocument:
+    """Fetch and convert a single page into a BedrockDocument ready for ingestion"""
+    # Storage content comes with the page listing (expand=body.storage), so
+    # there is no need to refetch the page here
     
+    # Get attachments and process images; only attachments referenced from the
+    # content can be rewritten, so skip the lookup for pages without any
+    page_content = page.get_storage_content() or ""
+    attachments = []
+    if '<ri:attachment' in page_content:
+        attachments = confluence_service.get_page_attachments(page.id)
+    
+    if attachments and page_content:
+        try:
+            processing_result = image_processor.process_page_images(
+                page.id, page_content, attachments
+            )
+            page_content = processing_result['modified_content']
+        except Exception as e:
+            logger.error(f"Image processing failed for page {page.id}: {e}")
+    
+    # Process content for Bedrock
+    processed_content = content_processor.process_confluence_content(
+        page_content, page.id, []
+    )
+    
+    # Create Bedrock document
+    metadata = BedrockMetadata(
+        title=page.title,
+        page_id=page.id,
+        space_key=space_key,
+        version=page.version_number,
+        last_modified=page.last_modified_datetime.isoformat() if page.last_modified_datetime else None,
+        url=f"{config.get_confluence_base_url()}/wiki/spaces/{space_key}/pages/{page.id}"
+    )
+    
+    return BedrockDocument(
+        document_id=f"confluence-{page.id}",
+        content=processed_content,
+        metadata=metadata
+    )
+
+
+def _ingest_batch(bedrock_service: BedrockService, batch: List[Any]) -> int:
+    """Ingest a batch of (page, document) pairs; returns the number ingested successfully"""
+    try:
+        ingest_results = bedrock_service.ingest_documents([doc for _, doc in batch])
+    except Exception as e:
+        if len(batch) == 1:
+            page = batch[0][0]
+            logger.error(f"Failed to ingest page {page.id}: {page.title}: {e}")
+            return 0
+        # One bad document fails the whole call, so retry each page on its own
+        # to lose only the pages that really fail
+        logger.warning(f"Failed to ingest batch of {len(batch)} pages, retrying one by one: {e}")
+        ingest_results = []
+        for page, doc in batch:
+            try:
+                result = bedrock_service.ingest_single_document(doc)
+            except Exception as page_error:
+                logger.error(f"Failed to ingest page {page.id}: {page.title}: {page_error}")
+                continue
+            if result:
+                ingest_results.append(result)
+    
+    statuses = {result.document_id: result.status for result in ingest_results}
+    succeeded = 0
+    for page, doc in batch:
+        if statuses.get(doc.document_id, 'FAILED') not in ['FAILED', 'IGNORED']:
+            succeeded += 1
+            logger.info(f"Successfully processed page {page.id}: {page.title}")
+        else:
+            logger.error(f"Failed to ingest page {page.id}: {page.title}")
+    
+    return succeeded
+
+
+def create_services(config: Any) -> Dict[str, Any]:
+    """Create the ingestion services once per invocation, backed by cached AWS clients"""
+    # Every page worker can upload image_workers images at once
+    s3_pool_size = max(10, (config.page_workers or 4) * config.image_workers)
+    s3_service = S3Service(config, s3_client=_get_client('s3', config.aws_region, s3_pool_size))
+    return {
+        'confluence': ConfluenceService(config),
+        'bedrock': BedrockService(
+            config,
+            bedrock_client=_get_client('bedrock-agent', config.aws_region),
+            bedrock_runtime_client=_get_client('bedrock-agent-runtime', config.aws_region)
+        ),
+        's3': s3_service,
+        'content': ContentProcessor(config),
+        'image': ImageProcessor(config, s3_service)
+    }
+
+
+def process_space_incrementally(space_key: str, config: Any, crawler_tracker: SSMCrawlTracker,
+                                services: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Process a single space incrementally"""
     logger.info(f"Processing space: {space_key}")
     
-    # Initialize services
-    confluence_service = ConfluenceService(config)
-    bedrock_service = BedrockService(config)
-    s3_service = S3Service(config)
-    content_processor = ContentProcessor(config)
-    image_processor = ImageProcessor(config, s3_service)
+    # Services are shared by all page workers (and by all spaces when passed in)
+    if services is None:
+        services = create_services(config)
+    confluence_service = services['confluence']
+    bedrock_service = services['bedrock']
+    content_processor = services['content']
+    image_processor = services['image']
     
     # Get last crawl time
     last_crawl = crawler_tracker.get_last_crawl_time(space_key)
@@ -186,68 +330,74 @@ def process_space_incrementally(space_key: str, config: Any, crawler_tracker: SS
     processed_count = 0
     current_time = datetime.now(timezone.utc)
     
-    # Process pages one by one with state updates
-    for page in pages_to_process:
-        try:
-            # Get full page content
-            if not page.get_storage_content():
-                full_page = confluence_service.get_page_by_id(page.id)
-                if full_page:
-                    page = full_page
-            
-            # Get attachments and process images
-            attachments = confluence_service.get_page_attachments(page.id)
-            page_content = page.get_storage_content() or ""
-            
-            if attachments and page_content:
-                try:
-                    processing_result = image_processor.process_page_images(
-                        page.id, page_content, attachments
-                    )
-                    page_content = processing_result['modified_content']
-                except Exception as e:
-                    logger.error(f"Image processing failed for page {page.id}: {e}")
-            
-            # Process content for Bedrock
-            processed_content = content_processor.process_confluence_content(
-                page_content, page.id, []
-            )
-            
-            # Create and ingest Bedrock document
-            metadata = BedrockMetadata(
-                title=page.title,
-                page_id=page.id,
-                space_key=space_key,
-                version=page.version_number,
-                last_modified=page.last_modified_datetime.isoformat() if page.last_modified_datetime else None,
-                url=f"{config.get_confluence_base_url()}/wiki/spaces/{space_key}/pages/{page.id}"
-            )
-            
-            bedrock_doc = BedrockDocument(
-                document_id=f"confluence-{page.id}",
-                content=processed_content,
-                metadata=metadata
-            )
+    # Pages finish out of order, so the checkpoint only advances past a page
+    # once every older page has finished (been ingested or failed) too
+    finished: List[int] = []  # min-heap of finished page indices
+    next_index = 0  # oldest page not yet finished
+    
+    def mark_finished(indices: List[int]) -> None:
+        nonlocal next_index
+        for index in indices:
+            heapq.heappush(finished, index)
+        advanced = False
+        while finished and finished[0] == next_index:
+            heapq.heappop(finished)
+            next_index += 1
+            advanced = True
+        
+        # Update crawl time to the watermark (for resumability)
+        if advanced:
+            page_time = pages_to_process[next_index - 1].last_modified_datetime or current_time
+            crawler_tracker.save_last_crawl_time(space_key, page_time)
+    
+    # Prepare pages concurrently and ingest them in batches
+    pending: List[tuple] = []  # (index, page, document) awaiting ingestion
+    pending_bytes = 0  # content size of the pending documents
+    
+    def flush_pending() -> None:
+        nonlocal processed_count, pending_bytes
+        processed_count += _ingest_batch(bedrock_service, [(page, doc) for _, page, doc in pending])
+        mark_finished([index for index, _, _ in pending])
+        pending.clear()
+        pending_bytes = 0
+    
+    with ThreadPoolExecutor(max_workers=config.page_workers or 4) as executor:
+        futures = {
+            executor.submit(
+                _prepare_page_document, page, space_key, config, confluence_service,
+                content_processor, image_processor
+            ): index
+            for index, page in enumerate(pages_to_process)
+        }
+        
+        for future in as_completed(futures):
+            # Drop consumed futures so finished documents are not kept alive
+            index = futures.pop(future)
+            page = pages_to_process[index]
+            try:
+                document = future.result()
+            except Exception as e:
+                # Failed pages are skipped, as in sequential processing
+                logger.error(f"Failed to process page {page.id}: {e}")
+                mark_finished([index])
+                continue
             
-            # Ingest single document
-            ingest_results = bedrock_service.ingest_documents([bedrock_doc])
+            # Flush first if this document would push the batch over the size cap
+            document_bytes = len(document.content.encode('utf-8'))
+            if pending and pending_bytes + document_bytes > INGEST_BATCH_MAX_BYTES:
+                flush_pending()
+            pending.append((index, page, document))
+            pending_bytes += document_bytes
             
-            if ingest_results and ingest_results[0].status not in ['FAILED', 'IGNORED']:
-                processed_count += 1
-                logger.info(f"Successfully processed page {page.id}: {page.title}")
-                
-                # Update crawl time after each successful page (for resumability)
-                page_time = page.last_modified_datetime or current_time
-                crawler_tracker.save_last_crawl_time(space_key, page_time)
-            else:
-                logger.error(f"Failed to ingest page {page.id}: {page.title}")
-                
-        except Exception as e:
-            logger.error(f"Failed to process page {page.id}: {e}")
-            continue
+            if len(pending) >= INGEST_BATCH_SIZE:
+                flush_pending()
+    
+    if pending:
+        flush_pending()
     
     # Final crawl time update
     crawler_tracker.save_last_crawl_time(space_key, current_time)
+    crawler_tracker.flush_and_wait()
     
     return {
         "status": "success",
@@ -267,7 +417,10 @@ def lambda_handler(event, context):
         
         # Initialize SSM tracker
         crawl_state_parameter = os.environ['CRAWL_STATE_PARAMETER']
-        crawler_tracker = SSMCrawlTracker(crawl_state_parameter)
+        crawler_tracker = SSMCrawlTracker(
+            crawl_state_parameter,
+            kms_key_id=os.environ.get('CRAWL_STATE_KMS_KEY_ID')
+        )
         
         # Get spaces to process from config
         spaces = config_dict.get('confluence_spaces', [])
@@ -276,6 +429,7 @@ def lambda_handler(event, context):
             return {"statusCode": 200, "body": json.dumps({"status": "no_spaces_configured"})}
         
         results = []
+        services = create_services(config)
         
         # Process each space
         for space_config in spaces:
@@ -288,7 +442,7 @@ def lambda_handler(event, context):
             config.confluence_space_key = space_key
             
             try:
-                result = process_space_incrementally(space_key, config, crawler_tracker)
+                result = process_space_incrementally(space_key, config, crawler_tracker, services)
                 results.append(result)
             except Exception as e:
                 logger.error(f"Failed to process space {space_key}: {e}")
@@ -1,7 +1,8 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import uuid
-from agentcore_client import AgentCoreClient
+import html
+import itertools
 
 # Page config
 st.set_page_config(
@@ -15,49 +16,160 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
+if "history_html" not in st.session_state:
+    # Concatenated HTML of messages[:last_rendered], extended as messages arrive
+    st.session_state.history_html = ""
+    st.session_state.last_rendered = 0
 
 # Initialize AgentCore client
 @st.cache_resource
 def get_agentcore_client():
-    return AgentCoreClient()
-
-client = get_agentcore_client()
-
-# Custom CSS for chat styling
-st.markdown("""
-<style>
-.user-message {
-    background: #007bff;
-    color: white;
-    padding: 8px 12px;
-    border-radius: 15px 15px 5px 15px;
-    margin: 5px 0 5px auto;
-    max-width: 80%;
-    word-wrap: break-word;
-    display: block;
-    text-align: right;
-}
-
-.assistant-message {
-    background: #f1f3f4;
-    color: #333;
-    padding: 8px 12px;
-    border-radius: 15px 15px 15px 5px;
-    margin: 5px auto 5px 0;
-    max-width: 80%;
-    word-wrap: break-word;
-    display: block;
-}
-
-.attached-article {
-    background: #e8f4fd;
-    border-left: 4px solid #007bff;
-    padding: 10px;
-    margin: 10px 0;
-    border-radius: 5px;
-}
-</style>
-""", unsafe_allow_html=True)
+    # Deferred so the first paint does not wait on importing boto3
+    from agentcore_client import get_shared_client
+    return get_shared_client()
+
+# Custom CSS for chat styling; messages are rendered inside the chat iframe,
+# so the styles ship with it instead of being injected into the page
+_CHAT_CSS = """
+        .user-message {
+            background: #007bff;
+            color: white;
+            padding: 8px 12px;
+            border-radius: 15px 15px 5px 15px;
+            margin: 5px 0 5px auto;
+            max-width: 80%;
+            word-wrap: break-word;
+            display: block;
+            text-align: right;
+        }
+        .assistant-message {
+            background: #f1f3f4;
+            color: #333;
+            padding: 8px 12px;
+            border-radius: 15px 15px 15px 5px;
+            margin: 5px auto 5px 0;
+            max-width: 80%;
+            word-wrap: break-word;
+            display: block;
+        }
+"""
+
+# Static scaffold of the chat iframe (plain strings, no formatting); all
+# messages share one iframe so the browser builds a single document per rerun
+_CHAT_IFRAME_HEAD = """
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        body { 
+            margin: 0; 
+            padding: 10px; 
+            max-width: 100%;
+            overflow-y: auto;
+            overflow-x: hidden;
+            box-sizing: border-box;
+        }
+        img {
+            max-width: 100% !important;
+            height: auto !important;
+            display: block;
+        }
+"""
+
+_CHAT_IFRAME_PREFIX = _CHAT_IFRAME_HEAD + _CHAT_CSS + """
+    </style>
+</head>
+<body>
+"""
+
+_CHAT_IFRAME_SUFFIX = """
+    <script>
+        // Coalesce height updates into at most one message per animation frame
+        let pendingFrame = 0;
+        function sendHeight() {
+            if (pendingFrame) {
+                return;
+            }
+            pendingFrame = requestAnimationFrame(() => {
+                pendingFrame = 0;
+                const height = document.body.scrollHeight + 20;
+                window.parent.postMessage({
+                    type: "streamlit:setFrameHeight",
+                    height: height
+                }, "*");
+            });
+        }
+        
+        // Wait for all images to load before calculating height
+        function waitForImages() {
+            const images = Array.from(document.getElementsByTagName('img'));
+            
+            if (images.length === 0) {
+                sendHeight();
+                return;
+            }
+            
+            const imagePromises = images.map(img => {
+                if (img.complete) {
+                    return Promise.resolve();
+                }
+                return new Promise((resolve) => {
+                    img.addEventListener('load', resolve);
+                    img.addEventListener('error', resolve);
+                });
+            });
+            
+            Promise.all(imagePromises).then(() => {
+                sendHeight();
+            });
+        }
+        
+        // Start waiting for images
+        if (document.readyState === 'complete') {
+            waitForImages();
+        } else {
+            window.addEventListener('load', waitForImages);
+        }
+        
+        // Re-send the height whenever layout actually changes
+        new ResizeObserver(() => sendHeight()).observe(document.body);
+    </script>
+</body>
+</html>
+"""
+
+
+def _message_fragment(message: dict) -> str:
+    """HTML block for one message; kept on the message so reruns reuse the same string"""
+    fragment = message.get("fragment")
+    if fragment is None:
+        if message["role"] == "assistant":
+            fragment = '<div class="assistant-message">' + message["content"] + '</div>'
+        else:
+            # User messages as plain text
+            fragment = '<div class="user-message">' + html.escape(message["content"]) + '</div>'
+        message["fragment"] = fragment
+    return fragment
+
+
+def render_messages(messages: list, height: int = 400):
+    """Render messages in a single iframe with dynamic height via postMessage"""
+    body = "".join(_message_fragment(message) for message in messages)
+    components.html(_CHAT_IFRAME_PREFIX + body + _CHAT_IFRAME_SUFFIX, height=height, scrolling=True)
+
+
+def render_history(height: int = 400):
+    """Render the whole conversation, only building HTML for messages added since the last rerun"""
+    messages = st.session_state.messages
+    if st.session_state.last_rendered < len(messages):
+        new_messages = messages[st.session_state.last_rendered:]
+        st.session_state.history_html += "".join(_message_fragment(message) for message in new_messages)
+        st.session_state.last_rendered = len(messages)
+    components.html(
+        _CHAT_IFRAME_PREFIX + st.session_state.history_html + _CHAT_IFRAME_SUFFIX,
+        height=height,
+        scrolling=True
+    )
 
 # Create two columns layout - make chat wider
 col1, col2 = st.columns([1, 1])
@@ -77,93 +189,14 @@ with col2:
         st.markdown("**💬 Assistant**")
         
         # Chat messages area with fixed height
-        with st.container(height=400):
+        messages_container = st.container(height=400)
+        with messages_container:
+            empty_hint = st.empty()
             if not st.session_state.messages:
-                st.markdown("*Start a conversation...*")
+                empty_hint.markdown("*Start a conversation...*")
             else:
-                for message in st.session_state.messages:
-                    with st.chat_message(message["role"]):
-                        if message["role"] == "assistant":
-                            # Render assistant HTML in iframe with dynamic height via postMessage
-                            html_with_resize = f"""
-                            <!DOCTYPE html>
-                            <html>
-                            <head>
-                                <style>
-                                    body {{ 
-                                        margin: 0; 
-                                        padding: 10px; 
-                                        max-width: 100%;
-                                        overflow-y: auto;
-                                        overflow-x: hidden;
-                                        box-sizing: border-box;
-                                    }}
-                                    img {{
-                                        max-width: 100% !important;
-                                        height: auto !important;
-                                        display: block;
-                                    }}
-                                </style>
-                            </head>
-                            <body>
-                                {message["content"]}
-                                <script>
-                                    function sendHeight() {{
-                                        const height = document.body.scrollHeight + 20;
-                                        window.parent.postMessage({{
-                                            type: "streamlit:setFrameHeight",
-                                            height: height
-                                        }}, "*");
-                                    }}
-                                    
-                                    // Wait for all images to load before calculating height
-                                    function waitForImages() {{
-                                        const images = Array.from(document.getElementsByTagName('img'));
-                                        
-                                        if (images.length === 0) {{
-                                            sendHeight();
-                                            return;
-                                        }}
-                                        
-                                        const imagePromises = images.map(img => {{
-                                            if (img.complete) {{
-                                                return Promise.resolve();
-                                            }}
-                                            return new Promise((resolve) => {{
-                                                img.addEventListener('load', resolve);
-                                                img.addEventListener('error', resolve);
-                                            }});
-                                        }});
-                                        
-                                        Promise.all(imagePromises).then(() => {{
-                                            sendHeight();
-                                        }});
-                                    }}
-                                    
-                                    // Start waiting for images
-                                    if (document.readyState === 'complete') {{
-                                        waitForImages();
-                                    }} else {{
-                                        window.addEventListener('load', waitForImages);
-                                    }}
-                                    
-                                    // Multiple fallback timeouts to catch any timing issues
-                                    setTimeout(sendHeight, 500);
-                                    setTimeout(sendHeight, 1000);
-                                    setTimeout(sendHeight, 1500);
-                                    setTimeout(sendHeight, 2000);
-                                    setTimeout(sendHeight, 3000);
-                                </script>
-                            </body>
-                            </html>
-                            """
-                            components.html(html_with_resize, height=600, scrolling=True)
-                        else:
-                            # User messages as plain text
-                            st.write(message["content"])
+                render_history()
         
-        loading_placeholder = st.empty()
-
         # Chat input at bottom of container
         user_input = st.chat_input("Ask a question...")
 
@@ -172,13 +205,26 @@ if user_input:
     # Add user message
     st.session_state.messages.append({"role": "user", "content": user_input})
     
-    # Get response from AgentCore (with built-in spinner)
-    with st.empty():
-        with loading_placeholder, st.spinner("⏳ Thinking..."):
-            response = client.invoke_agent(user_input, st.session_state.session_id)
-
-    # Add assistant response
-    st.session_state.messages.append({"role": "assistant", "content": response})
-
-    # Single rerun to refresh the display
-    st.rerun()
\ No newline at end of file
+    # Show the new turn in place instead of rerunning the whole script, which
+    # would rebuild the chat history iframe
+    with messages_container:
+        empty_hint.empty()
+        with st.chat_message("user"):
+            st.write(user_input)
+        
+        with st.chat_message("assistant"):
+            # Stream the answer as text while it arrives, then swap in the rendered HTML.
+            # A JSON (non-streaming) agent response arrives in one piece at the end,
+            # so keep the spinner up until the first chunk is in.
+            answer_placeholder = st.empty()
+            answer_stream = get_agentcore_client().invoke_agent_stream(user_input, st.session_state.session_id)
+            with answer_placeholder.container():
+                with st.spinner("⏳ Thinking..."):
+                    first_chunk = next(answer_stream, "")
+                response = st.write_stream(itertools.chain([first_chunk], answer_stream))
+            
+            # Add assistant response
+            assistant_message = {"role": "assistant", "content": response}
+            st.session_state.messages.append(assistant_message)
+            with answer_placeholder.container():
+                render_messages([assistant_message])